@@ -15,18 +15,29 @@ from db import (
     list_products,
     upsert_product,
     delete_product,
-    # fixed prices
-    set_fixed_price,
-    get_price_for_customer_product,
+    # price books
+    add_price_book_entry,
+    delete_price_book_entry,
+    list_price_book,
+    list_products_with_prices,
     # orders
     list_orders,
     add_order,
     add_order_line,
     list_order_lines,
+    list_order_details,
+    get_orders_with_lines,
+    count_orders,
     update_order_status,
-    delete_order,
+    bulk_update_order_status,
+    bulk_delete_orders,
+    ORDER_STATUSES,
+    BULK_STATUSES,
     # customers
     list_customers_full,
+    search_customers,
+    count_customers,
+    get_customer,
     create_customer,
     update_customer,
     # announcements
@@ -34,6 +45,7 @@ from db import (
     create_announcement,
     deactivate_announcement,
 )
+from pr_docs import generate_pr_document, generate_pr_bundle
 
 # ---------------- App Config ----------------
 st.set_page_config(
@@ -62,6 +74,44 @@ def money(v: float) -> str:
     except Exception:
         return "$0.00"
 
+CUSTOMER_PAGE_SIZE = 50
+
+def customer_picker(key: str, label: str = "Customer", show_table: bool = False):
+    """Paginated prefix search over the customer directory. Returns the selected customer id or None."""
+    f1, f2, f3 = st.columns([3, 1, 1])
+    with f1:
+        q = st.text_input(f"Search {label} (prefix)", key=f"{key}_q").strip()
+    with f2:
+        field = st.selectbox("By", ["any", "name", "username", "location", "type"], key=f"{key}_field")
+    total = count_customers(q, field)
+    pages = max(1, (total + CUSTOMER_PAGE_SIZE - 1) // CUSTOMER_PAGE_SIZE)
+    with f3:
+        page_no = st.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+    rows = search_customers(q, field, limit=CUSTOMER_PAGE_SIZE, offset=(int(page_no) - 1) * CUSTOMER_PAGE_SIZE)
+    st.caption(f"{total} match(es) • page {int(page_no)} of {pages}")
+    if show_table:
+        df_preview(pd.DataFrame(rows))
+    if not rows:
+        st.info("No matching customers.")
+        return None
+    labels = {r["id"]: f"{r['name'] or r['username']} ({r['username']})" for r in rows}
+    return st.selectbox(label, list(labels.keys()), format_func=lambda i: labels[i], key=f"{key}_sel")
+
+ORDER_PAGE_SIZE = 50
+
+def show_order_details(orders: List[Dict[str, Any]]):
+    """Expandable per-order line items (orders as returned by list_order_details)."""
+    for o in orders:
+        header = f"Order #{o['id']} • {o['status']} • {(o['created_at'] or '')[:10]} • {money(o['total_usd'])}"
+        if o.get("pr_number"):
+            header += f" • {o['pr_number']}"
+        with st.expander(header):
+            if not o["lines"]:
+                st.info("No lines.")
+                continue
+            lines = pd.DataFrame(o["lines"])[["code", "name", "qty", "unit_price_usd", "line_total_usd"]]
+            df_preview(lines, height=min(280, 40 + 35 * len(lines)))
+
 def require_login() -> Dict[str, Any]:
     """Simple username/password login. Returns user dict or shows form."""
     if "user" in st.session_state and st.session_state["user"]:
@@ -142,35 +192,109 @@ def admin_home():
     st.subheader("Dashboard (quick stats)")
     orders = list_orders()
     products = list_products()
-    customers = list_customers_full()
     c1, c2, c3 = st.columns(3)
     with c1:
         st.metric("Total Orders", len(orders))
     with c2:
         st.metric("Catalog Size", len(products))
     with c3:
-        st.metric("Customers", len(customers))
+        st.metric("Customers", count_customers())
     st.markdown("### Recent Orders")
-    df_preview(pd.DataFrame(orders).sort_values("created_at", ascending=False))
+    df_preview(pd.DataFrame(orders))  # list_orders() is already newest first
+
+def reset_order_selection():
+    """Drop the orders table selection and its checkboxes, then rerun."""
+    prefixes = ("orders_table_", "orders_apply_all_", "orders_confirm_delete_")
+    for k in [k for k in st.session_state.keys() if str(k).startswith(prefixes)]:
+        del st.session_state[k]
+    st.session_state["orders_sel_gen"] = st.session_state.get("orders_sel_gen", 0) + 1
+    st.rerun()
 
 def admin_orders():
     st.subheader("All Orders")
+    if st.session_state.get("bulk_result"):
+        msg, rejected = st.session_state.pop("bulk_result")
+        st.success(msg)
+        if rejected:
+            st.warning(f"{len(rejected)} order(s) skipped.")
+            df_preview(pd.DataFrame([{"id": k, "reason": v} for k, v in rejected.items()]), height=160)
     df = pd.DataFrame(list_orders())
-    df_preview(df)
-    st.markdown("### Update Status")
-    if not df.empty:
-        oid = st.number_input("Order ID", min_value=int(df["id"].min()), step=1)
-        new_status = st.selectbox("New Status", ["Draft", "Pending", "PR Generated", "Submitted", "Cancelled"])
-        if st.button("Update"):
-            update_order_status(int(oid), new_status)
-            st.success("Updated.")
-            st.rerun()
-        st.markdown("### Delete Order")
-        del_id = st.number_input("Delete Order ID", min_value=int(df["id"].min()), step=1, key="del_order_id")
-        if st.button("Delete Order"):
-            delete_order(int(del_id))
-            st.warning("Order deleted.")
-            st.rerun()
+    if df.empty:
+        st.info("No data.")
+        return
+    df["month"] = df["created_at"].str[:7]
+    f1, f2 = st.columns(2)
+    with f1:
+        f_month = st.selectbox("Month", ["All"] + sorted(df["month"].dropna().unique().tolist(), reverse=True))
+    with f2:
+        f_status = st.selectbox("Status", ["All"] + ORDER_STATUSES)
+    if f_month != "All":
+        df = df[df["month"] == f_month]
+    if f_status != "All":
+        df = df[df["status"] == f_status]
+    df = df.drop(columns=["month"]).reset_index(drop=True)
+
+    # Selection is kept by row position, so the table (and the checkboxes acting on it) get
+    # fresh keys whenever the shown orders change or a bulk action completes.
+    gen = st.session_state.setdefault("orders_sel_gen", 0)
+    event = st.dataframe(
+        title_case_cols(df), use_container_width=True, height=320,
+        on_select="rerun", selection_mode="multi-row",
+        key=f"orders_table_{gen}_{f_month}_{f_status}_{hash(tuple(df['id']))}",
+    )
+    apply_all = st.checkbox(f"Apply to all {len(df)} shown orders", key=f"orders_apply_all_{gen}")
+    rows = [r for r in event.selection.rows if 0 <= r < len(df)]
+    sel_ids = df["id"].tolist() if apply_all else df.iloc[rows]["id"].tolist()
+    st.caption(f"{len(sel_ids)} order(s) selected.")
+    if sel_ids:
+        st.markdown("### Selected Order Details")
+        if len(sel_ids) > ORDER_PAGE_SIZE:
+            st.caption(f"Showing the first {ORDER_PAGE_SIZE} selected orders.")
+        show_order_details(get_orders_with_lines(sel_ids[:ORDER_PAGE_SIZE]))
+
+    st.markdown("### Bulk Status Update")
+    c1, c2, c3 = st.columns([2, 1, 1])
+    with c1:
+        new_status = st.selectbox("New Status", BULK_STATUSES)
+    with c2:
+        if st.button("Update Selected") and sel_ids:
+            updated, rejected = bulk_update_order_status(sel_ids, new_status)
+            st.session_state["bulk_result"] = (f"{len(updated)} order(s) set to {new_status}.", rejected)
+            reset_order_selection()
+    with c3:
+        if st.button("Cancel Selected") and sel_ids:
+            updated, rejected = bulk_update_order_status(sel_ids, "Cancelled")
+            st.session_state["bulk_result"] = (f"{len(updated)} order(s) cancelled.", rejected)
+            reset_order_selection()
+
+    st.markdown("### Delete Orders")
+    confirm = st.checkbox(
+        f"Confirm deleting {len(sel_ids)} selected order(s) with their lines and PR records",
+        key=f"orders_confirm_delete_{gen}",
+    )
+    if st.button("Delete Selected"):
+        if sel_ids and confirm:
+            n = bulk_delete_orders(sel_ids)
+            st.session_state["bulk_result"] = (f"{n} order(s) deleted.", {})
+            reset_order_selection()
+
+    st.markdown("### Purchase Requests")
+    if st.button("Generate PR Documents for Selected"):
+        if sel_ids:
+            with st.spinner("Generating purchase requests..."):
+                numbers, skipped, bundle = generate_pr_bundle(sel_ids)
+            st.session_state["pr_bundle"] = bundle if numbers else None
+            st.success(f"{len(numbers)} purchase request(s) generated.")
+            if skipped:
+                st.warning(f"{len(skipped)} order(s) skipped.")
+                df_preview(pd.DataFrame([{"id": k, "reason": v} for k, v in skipped.items()]), height=160)
+    if st.session_state.get("pr_bundle"):
+        st.download_button(
+            "Download PR Documents (ZIP)",
+            st.session_state["pr_bundle"],
+            file_name=f"purchase_requests_{datetime.utcnow().strftime('%Y%m%d')}.zip",
+            mime="application/zip",
+        )
 
 def admin_catalog():
     st.subheader("Add / Edit Product (USD)")
@@ -227,24 +351,37 @@ def admin_catalog():
             st.warning("Product deleted (if existed).")
             st.rerun()
 
-    st.markdown("### Fixed Price per Customer")
-    customers = list_customers_full()
-    cust_names = [c["name"] for c in customers]
+    st.markdown("### Price Book per Customer")
+    sel_cust = customer_picker("price_cust")
     products = list_products()
     prod_names = [p["name"] for p in products]
-    c1, c2, c3 = st.columns(3)
-    with c1:
-        sel_cust = st.selectbox("Customer", cust_names) if cust_names else None
+    c2, c3 = st.columns(2)
     with c2:
         sel_prod = st.selectbox("Product", prod_names) if prod_names else None
     with c3:
         price = st.number_input("Fixed Price (USD)", min_value=0.0, step=1.0)
-    if st.button("Set Fixed Price"):
+    d1, d2 = st.columns(2)
+    with d1:
+        valid_from = st.date_input("Valid From", value=datetime.utcnow().date(), format="YYYY-MM-DD")
+    with d2:
+        valid_to = st.date_input("Valid To (blank = open-ended)", value=None, format="YYYY-MM-DD")
+    if st.button("Add Price"):
         if sel_cust and sel_prod:
-            cid = [c for c in customers if c["name"] == sel_cust][0]["id"]
             pid = [p for p in products if p["name"] == sel_prod][0]["id"]
-            set_fixed_price(cid, pid, price)
-            st.success("Fixed price saved.")
+            try:
+                add_price_book_entry(sel_cust, pid, price, str(valid_from), str(valid_to) if valid_to else None)
+                st.success("Price saved.")
+            except ValueError as e:
+                st.error(str(e))
+    if sel_cust:
+        book = list_price_book(sel_cust)
+        df_preview(pd.DataFrame(book), height=220)
+        if book:
+            del_entry = st.selectbox("Price entry to remove", [b["id"] for b in book], key="del_price_entry")
+            if st.button("Remove Price Entry"):
+                delete_price_book_entry(int(del_entry))
+                st.warning("Price entry removed.")
+                st.rerun()
 
 def admin_customers():
     st.subheader("Create Customer")
@@ -280,16 +417,10 @@ def admin_customers():
             st.success("Customer created.")
 
     st.markdown("### Customer List & Edit")
-    df = pd.DataFrame(list_customers_full())
-    df_preview(df)
-
-    if not df.empty:
-        # picker
-        df["display"] = df.apply(lambda r: f"{r['name']} (ID {r['id']})", axis=1)
-        selection = st.selectbox("Select Customer to Edit", df["display"].tolist())
-        sel_id = int(selection.split("ID")[-1].strip(" )"))
+    sel_id = customer_picker("edit_cust", label="Select Customer to Edit", show_table=True)
 
-        sel = df[df["id"] == sel_id].iloc[0].to_dict()
+    sel = get_customer(sel_id) if sel_id is not None else None
+    if sel:
         with st.form("edit_customer"):
             st.subheader("Edit Customer Info")
             e1, e2 = st.columns(2)
@@ -393,7 +524,7 @@ def customer_place_order():
     with f4:
         q = st.text_input("Search (code or name)").strip()
 
-    df = pd.DataFrame(list_products())
+    df = pd.DataFrame(list_products_with_prices(user["id"]))
     if not df.empty:
         if f_section != "All":
             df = df[df["section"] == f_section]
@@ -414,7 +545,7 @@ def customer_place_order():
                 with top[0]:
                     st.markdown(f"**{row['name']}**")
                     st.caption(f"{row['code']} • {row['section']} • {row['analyser']} • Kit {row['kit_size']}")
-                price = get_price_for_customer_product(user["id"], int(row["id"])) or row["default_price_usd"] or 0.0
+                price = row["price_usd"] or 0.0
                 with top[1]:
                     st.markdown("Price")
                     st.markdown(f"**{money(price)}**")
@@ -440,6 +571,7 @@ def customer_place_order():
                 add_order_line(order_id, item["product_id"], item["qty"])
             ss["order_id"] = order_id
             ss["status"] = "Draft"
+            ss["pr_doc"] = None
             st.success(f"Order #{order_id} created.")
             ss["cart"] = []
             st.rerun()
@@ -450,10 +582,20 @@ def customer_place_order():
         c1, c2, c3 = st.columns(3)
         with c1:
             if st.button("Generate Purchase Request"):
-                pr = f"PR-{user['id']}-{datetime.utcnow().strftime('%m%d%H%M%S')}"
-                update_order_status(ss["order_id"], "PR Generated", pr_number=pr)
-                ss["status"] = "PR Generated"
-                st.success(f"PR generated: {pr}")
+                try:
+                    order, filename, data = generate_pr_document(ss["order_id"])
+                    ss["status"] = order["status"]
+                    ss["pr_doc"] = (filename, data)
+                    st.success(f"PR generated: {order['pr_number']}")
+                except ValueError as e:
+                    st.error(str(e))
+            if ss.get("pr_doc"):
+                st.download_button(
+                    "Download Purchase Request",
+                    ss["pr_doc"][1],
+                    file_name=ss["pr_doc"][0],
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                )
         with c2:
             if st.button("Confirm and Submit"):
                 update_order_status(ss["order_id"], "Submitted")
@@ -466,8 +608,16 @@ def customer_place_order():
 
 def customer_track():
     st.subheader("Track Orders")
-    df = pd.DataFrame(list_orders(customer_id=user["id"]))
-    df_preview(df)
+    total = count_orders(customer_id=user["id"])
+    if not total:
+        st.info("No orders yet.")
+        return
+    pages = max(1, (total + ORDER_PAGE_SIZE - 1) // ORDER_PAGE_SIZE)
+    page_no = st.number_input("Page", min_value=1, max_value=pages, step=1, key="track_page")
+    st.caption(f"{total} order(s) • page {int(page_no)} of {pages}")
+    show_order_details(list_order_details(
+        customer_id=user["id"], limit=ORDER_PAGE_SIZE, offset=(int(page_no) - 1) * ORDER_PAGE_SIZE,
+    ))
 
 def customer_profile():
     st.subheader("Profile")
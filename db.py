@@ -2,12 +2,13 @@
 # db.py — SQLite helpers for Orders Portal
 # UTF-8
 
+import os
 import sqlite3
 from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
-DB_PATH = "db.sqlite"
+DB_PATH = os.environ.get("ORDERS_PORTAL_DB", "db.sqlite")
 
 @contextmanager
 def get_conn():
@@ -58,6 +59,25 @@ def init_db():
             PRIMARY KEY(customer_id, product_id)
         )
         """)
+        # price books (effective-dated customer prices; valid_to inclusive, NULL = open-ended)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS price_books(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER,
+            product_id INTEGER,
+            price_usd REAL,
+            valid_from TEXT,
+            valid_to TEXT,
+            created_at TEXT
+        )
+        """)
+        # key/value settings (e.g. as-of date of the current-price table)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS meta(
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """)
         # orders
         cur.execute("""
         CREATE TABLE IF NOT EXISTS orders(
@@ -77,6 +97,15 @@ def init_db():
             qty INTEGER
         )
         """)
+        # purchase requests (id is the PR sequence)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS purchase_requests(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER UNIQUE,
+            pr_number TEXT UNIQUE,
+            created_at TEXT
+        )
+        """)
         # announcements
         cur.execute("""
         CREATE TABLE IF NOT EXISTS announcements(
@@ -88,6 +117,29 @@ def init_db():
         )
         """)
 
+        # indexes
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_customers_name ON customers(name COLLATE NOCASE)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_customers_username ON customers(username COLLATE NOCASE)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_customers_location ON customers(location COLLATE NOCASE)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_customers_type ON customers(type COLLATE NOCASE)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_price_books_lookup ON price_books(customer_id, product_id, valid_from)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_order_lines_order ON order_lines(order_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_orders_created ON orders(created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_orders_customer_created ON orders(customer_id, created_at)")
+
+        # migrate legacy fixed prices into open-ended price book entries (once, recorded in meta)
+        cur.execute("SELECT 1 FROM meta WHERE key='price_books_migrated'")
+        if cur.fetchone() is None:
+            cur.execute("""
+                INSERT INTO meta(key, value) VALUES('price_books_migrated', ?)
+                ON CONFLICT(key) DO NOTHING
+            """, (datetime.utcnow().isoformat(),))
+            if cur.rowcount == 1:  # this call claimed the migration
+                cur.execute("""
+                    INSERT INTO price_books(customer_id, product_id, price_usd, valid_from, valid_to, created_at)
+                    SELECT customer_id, product_id, price_usd, ?, NULL, ? FROM fixed_prices
+                """, (PRICE_BOOK_MIN_DATE, datetime.utcnow().isoformat()))
+
         # seed admin
         cur.execute("SELECT COUNT(*) FROM customers WHERE username='admin'",)
         if cur.fetchone()[0] == 0:
@@ -138,22 +190,131 @@ def delete_product(code: str):
     with get_conn() as con:
         con.execute("DELETE FROM products WHERE code=?", (code,))
 
-# ---------------- Fixed prices ----------------
+# ---------------- Price books ----------------
+# price_books holds effective-dated prices; fixed_prices is the precomputed
+# current-price table for the as-of date stored in meta['prices_as_of'].
+PRICE_BOOK_MIN_DATE = "0001-01-01"
+
+def _today() -> str:
+    return datetime.utcnow().date().isoformat()
+
+# Latest-starting entry whose [valid_from, valid_to] window contains the as-of date.
+_EFFECTIVE_PRICES_SQL = """
+    SELECT customer_id, product_id, price_usd FROM (
+        SELECT customer_id, product_id, price_usd,
+               ROW_NUMBER() OVER (
+                   PARTITION BY customer_id, product_id
+                   ORDER BY valid_from DESC, id DESC
+               ) AS rn
+        FROM price_books
+        WHERE {where} valid_from <= :as_of AND (valid_to IS NULL OR valid_to >= :as_of)
+    ) WHERE rn = 1
+"""
+
+def add_price_book_entry(
+    customer_id: int,
+    product_id: int,
+    price_usd: float,
+    valid_from: Optional[str] = None,
+    valid_to: Optional[str] = None,
+) -> int:
+    valid_from = valid_from or _today()
+    if valid_to is not None and valid_to < valid_from:
+        raise ValueError("valid_to must not be before valid_from")
+    with get_conn() as con:
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            INSERT INTO price_books(customer_id, product_id, price_usd, valid_from, valid_to, created_at)
+            VALUES(?,?,?,?,?,?)
+        """, (int(customer_id), int(product_id), float(price_usd), valid_from, valid_to, datetime.utcnow().isoformat()))
+        entry_id = cur.lastrowid
+        _rebuild_current_prices(con, _today(), customer_id)
+    return entry_id
+
 def set_fixed_price(customer_id: int, product_id: int, price_usd: float):
+    """Open-ended price starting today; earlier entries are kept for history."""
+    add_price_book_entry(customer_id, product_id, price_usd)
+
+def delete_price_book_entry(entry_id: int):
     with get_conn() as con:
-        con.execute("""
-            INSERT INTO fixed_prices(customer_id, product_id, price_usd)
-            VALUES(?,?,?)
-            ON CONFLICT(customer_id, product_id) DO UPDATE SET price_usd=excluded.price_usd
-        """, (int(customer_id), int(product_id), float(price_usd)))
+        con.execute("BEGIN IMMEDIATE")
+        row = con.execute("SELECT customer_id FROM price_books WHERE id=?", (int(entry_id),)).fetchone()
+        if row:
+            con.execute("DELETE FROM price_books WHERE id=?", (int(entry_id),))
+            _rebuild_current_prices(con, _today(), row["customer_id"])
 
-def get_price_for_customer_product(customer_id: int, product_id: int) -> Optional[float]:
+def list_price_book(customer_id: int) -> List[Dict[str, Any]]:
     with get_conn() as con:
-        row = con.execute("""
-            SELECT price_usd FROM fixed_prices
-            WHERE customer_id=? AND product_id=?
-        """, (int(customer_id), int(product_id))).fetchone()
-        return float(row["price_usd"]) if row else None
+        rows = con.execute("""
+            SELECT pb.id, pb.product_id, p.code, p.name, pb.price_usd, pb.valid_from, pb.valid_to
+            FROM price_books pb LEFT JOIN products p ON p.id = pb.product_id
+            WHERE pb.customer_id=?
+            ORDER BY p.name, pb.valid_from DESC
+        """, (int(customer_id),)).fetchall()
+        return [dict(r) for r in rows]
+
+def _prices_as_of(con) -> Optional[str]:
+    row = con.execute("SELECT value FROM meta WHERE key='prices_as_of'").fetchone()
+    return row["value"] if row else None
+
+def _rebuild_current_prices(con, as_of: str, customer_id: Optional[int] = None):
+    """Rebuild fixed_prices inside the caller's write transaction."""
+    if customer_id is not None and _prices_as_of(con) != as_of:
+        customer_id = None  # cache is stale (or missing) for everyone; rebuild it all
+    if customer_id is None:
+        con.execute("DELETE FROM fixed_prices")
+        con.execute(
+            "INSERT INTO fixed_prices(customer_id, product_id, price_usd) " + _EFFECTIVE_PRICES_SQL.format(where=""),
+            {"as_of": as_of},
+        )
+    else:
+        con.execute("DELETE FROM fixed_prices WHERE customer_id=?", (int(customer_id),))
+        con.execute(
+            "INSERT INTO fixed_prices(customer_id, product_id, price_usd) "
+            + _EFFECTIVE_PRICES_SQL.format(where="customer_id = :cid AND"),
+            {"cid": int(customer_id), "as_of": as_of},
+        )
+    con.execute("""
+        INSERT INTO meta(key, value) VALUES('prices_as_of', ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value
+    """, (as_of,))
+
+def refresh_current_prices(as_of: Optional[str] = None, customer_id: Optional[int] = None):
+    """Rebuild fixed_prices for `as_of` (default today), for one customer or everyone."""
+    with get_conn() as con:
+        con.execute("BEGIN IMMEDIATE")
+        _rebuild_current_prices(con, as_of or _today(), customer_id)
+
+def _ensure_current_prices():
+    """Rebuild fixed_prices once per day; concurrent callers wait for the first rebuild instead of repeating it."""
+    today = _today()
+    with get_conn() as con:
+        if _prices_as_of(con) == today:
+            return
+        con.execute("BEGIN IMMEDIATE")
+        if _prices_as_of(con) != today:  # re-check under the write lock
+            _rebuild_current_prices(con, today)
+
+def list_products_with_prices(customer_id: int, as_of: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Whole catalog with the customer's effective price (falling back to the default) in one query."""
+    if as_of is None or as_of == _today():
+        _ensure_current_prices()
+        price_src = "SELECT product_id, price_usd FROM fixed_prices WHERE customer_id = :cid"
+        params: Dict[str, Any] = {"cid": int(customer_id)}
+    else:
+        price_src = _EFFECTIVE_PRICES_SQL.format(where="customer_id = :cid AND")
+        params = {"cid": int(customer_id), "as_of": as_of}
+    with get_conn() as con:
+        rows = con.execute(f"""
+            SELECT p.id, p.code, p.name, p.section, p.analyser, p.kit_size, p.default_price_usd,
+                   COALESCE(fp.price_usd, p.default_price_usd, 0.0) AS price_usd,
+                   fp.price_usd IS NOT NULL AS has_fixed_price
+            FROM products p
+            LEFT JOIN ({price_src}) fp ON fp.product_id = p.id
+            ORDER BY p.name
+        """, params).fetchall()
+        return [dict(r) for r in rows]
 
 # ---------------- Orders ----------------
 def add_order(customer_id: int, status: str = "Draft") -> int:
@@ -182,8 +343,60 @@ def update_order_status(order_id: int, status: str, pr_number: Optional[str] = N
 def delete_order(order_id: int):
     with get_conn() as con:
         con.execute("DELETE FROM order_lines WHERE order_id=?", (int(order_id),))
+        con.execute("DELETE FROM purchase_requests WHERE order_id=?", (int(order_id),))
         con.execute("DELETE FROM orders WHERE id=?", (int(order_id),))
 
+ORDER_STATUSES = ["Draft", "Pending", "PR Generated", "Submitted", "Cancelled"]
+
+# Allowed status changes for bulk admin operations (from -> to). "PR Generated" is
+# never a bulk target: it is only reached through issue_pr_numbers(), which assigns the number.
+ORDER_TRANSITIONS = {
+    "Draft": {"Pending", "Submitted", "Cancelled"},
+    "Pending": {"Draft", "Submitted", "Cancelled"},
+    "PR Generated": {"Pending", "Submitted", "Cancelled"},
+    "Submitted": {"Cancelled"},
+    "Cancelled": {"Draft"},
+}
+BULK_STATUSES = [s for s in ORDER_STATUSES if any(s in to for to in ORDER_TRANSITIONS.values())]
+
+def bulk_update_order_status(order_ids: List[int], status: str) -> Tuple[List[int], Dict[int, str]]:
+    """Move many orders to `status` in one transaction. Returns (updated ids, {rejected id: reason})."""
+    if status not in BULK_STATUSES:
+        raise ValueError(f"Status {status!r} cannot be set in bulk")
+    ids = list(dict.fromkeys(int(i) for i in order_ids))
+    if not ids:
+        return [], {}
+    updated: List[int] = []
+    rejected: Dict[int, str] = {}
+    with get_conn() as con:
+        con.execute("BEGIN IMMEDIATE")  # check and update under the same write lock
+        rows = con.execute(f"""
+            SELECT id, status FROM orders WHERE id IN ({",".join("?" * len(ids))})
+        """, ids).fetchall()
+        current = {r["id"]: r["status"] for r in rows}
+        for oid in ids:
+            if oid not in current:
+                rejected[oid] = "not found"
+            elif current[oid] == status:
+                rejected[oid] = f"already {status}"
+            elif status not in ORDER_TRANSITIONS.get(current[oid], set()):
+                rejected[oid] = f"{current[oid]} → {status} not allowed"
+            else:
+                updated.append(oid)
+        con.executemany("UPDATE orders SET status=? WHERE id=?", [(status, oid) for oid in updated])
+    return updated, rejected
+
+def bulk_delete_orders(order_ids: List[int]) -> int:
+    """Delete many orders with their lines and PR records in one transaction. Returns the number of orders removed."""
+    params = [(i,) for i in dict.fromkeys(int(i) for i in order_ids)]
+    if not params:
+        return 0
+    with get_conn() as con:
+        con.executemany("DELETE FROM order_lines WHERE order_id=?", params)
+        con.executemany("DELETE FROM purchase_requests WHERE order_id=?", params)
+        cur = con.executemany("DELETE FROM orders WHERE id=?", params)
+        return cur.rowcount
+
 def list_orders(customer_id: Optional[int] = None) -> List[Dict[str, Any]]:
     with get_conn() as con:
         if customer_id is None:
@@ -206,6 +419,133 @@ def list_order_lines(order_id: int) -> List[Dict[str, Any]]:
         """, (int(order_id),)).fetchall()
         return [dict(r) for r in rows]
 
+# Unit price of a line as of the order date: price book entry in effect, else the default.
+_LINE_PRICE_SQL = """
+    COALESCE((
+        SELECT pb.price_usd FROM price_books pb
+        WHERE pb.customer_id = o.customer_id AND pb.product_id = ol.product_id
+          AND pb.valid_from <= date(o.created_at)
+          AND (pb.valid_to IS NULL OR pb.valid_to >= date(o.created_at))
+        ORDER BY pb.valid_from DESC, pb.id DESC LIMIT 1
+    ), p.default_price_usd, 0.0)
+"""
+
+# Orders (already filtered/paged by the {orders} subquery) joined with customers, lines and products.
+_ORDER_DETAIL_SQL = """
+    SELECT o.id AS order_id, o.customer_id, o.status, o.pr_number, o.created_at,
+           c.name AS customer_name, c.location AS customer_location,
+           ol.id AS line_id, ol.product_id, ol.qty,
+           p.code AS product_code, p.name AS product_name,
+           {line_price} AS unit_price_usd
+    FROM ({orders}) o
+    LEFT JOIN customers c ON c.id = o.customer_id
+    LEFT JOIN order_lines ol ON ol.order_id = o.id
+    LEFT JOIN products p ON p.id = ol.product_id
+    ORDER BY o.created_at DESC, o.id DESC, ol.id
+"""
+
+def _group_order_rows(rows) -> List[Dict[str, Any]]:
+    orders: Dict[int, Dict[str, Any]] = {}
+    for r in rows:
+        o = orders.get(r["order_id"])
+        if o is None:
+            o = orders[r["order_id"]] = {
+                "id": r["order_id"], "customer_id": r["customer_id"], "customer_name": r["customer_name"],
+                "customer_location": r["customer_location"], "status": r["status"],
+                "pr_number": r["pr_number"], "created_at": r["created_at"], "lines": [], "total_usd": 0.0,
+            }
+        if r["line_id"] is None:
+            continue
+        line_total = float(r["unit_price_usd"]) * int(r["qty"])
+        o["lines"].append({
+            "product_id": r["product_id"], "code": r["product_code"], "name": r["product_name"],
+            "qty": int(r["qty"]), "unit_price_usd": float(r["unit_price_usd"]), "line_total_usd": line_total,
+        })
+        o["total_usd"] += line_total
+    return list(orders.values())
+
+def get_orders_with_lines(order_ids: List[int]) -> List[Dict[str, Any]]:
+    """Order headers with priced lines for the given ids, fetched in one joined query."""
+    ids = [int(i) for i in order_ids]
+    if not ids:
+        return []
+    page = f"SELECT * FROM orders WHERE id IN ({','.join('?' * len(ids))})"
+    with get_conn() as con:
+        rows = con.execute(_ORDER_DETAIL_SQL.format(orders=page, line_price=_LINE_PRICE_SQL), ids).fetchall()
+    return _group_order_rows(rows)
+
+def _order_filter(customer_id: Optional[int], status: Optional[str]):
+    where, vals = [], []
+    if customer_id is not None:
+        where.append("customer_id=?"); vals.append(int(customer_id))
+    if status is not None:
+        where.append("status=?"); vals.append(status)
+    return (f"WHERE {' AND '.join(where)}" if where else ""), vals
+
+def list_order_details(
+    customer_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """A page of orders (newest first) with lines, product names/codes and prices, in one query."""
+    where, vals = _order_filter(customer_id, status)
+    page = f"SELECT * FROM orders {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+    with get_conn() as con:
+        rows = con.execute(
+            _ORDER_DETAIL_SQL.format(orders=page, line_price=_LINE_PRICE_SQL),
+            vals + [int(limit), int(offset)],
+        ).fetchall()
+    return _group_order_rows(rows)
+
+def count_orders(customer_id: Optional[int] = None, status: Optional[str] = None) -> int:
+    where, vals = _order_filter(customer_id, status)
+    with get_conn() as con:
+        return con.execute(f"SELECT COUNT(*) FROM orders {where}", vals).fetchone()[0]
+
+# ---------------- Purchase requests ----------------
+def issue_pr_numbers(order_ids: List[int]) -> Tuple[Dict[int, str], Dict[int, str]]:
+    """Assign sequence-based PR numbers (PR-YYYY-NNNNNN) in one transaction; orders that already have one keep it.
+
+    Returns ({order id: pr number}, {skipped id: reason}); cancelled and empty orders are skipped.
+    """
+    ids = list(dict.fromkeys(int(i) for i in order_ids))
+    if not ids:
+        return {}, {}
+    now = datetime.utcnow()
+    out: Dict[int, str] = {}
+    skipped: Dict[int, str] = {}
+    with get_conn() as con:
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")  # read and allocate under the write lock
+        rows = cur.execute(f"""
+            SELECT o.id, o.status, o.pr_number,
+                   EXISTS(SELECT 1 FROM order_lines ol WHERE ol.order_id = o.id) AS has_lines
+            FROM orders o WHERE o.id IN ({",".join("?" * len(ids))})
+        """, ids).fetchall()
+        found = {r["id"]: r for r in rows}
+        for oid in ids:
+            row = found.get(oid)
+            if row is None:
+                skipped[oid] = "not found"
+            elif row["status"] == "Cancelled":
+                skipped[oid] = "cancelled"
+            elif not row["has_lines"]:
+                skipped[oid] = "no lines"
+            elif row["pr_number"]:
+                out[oid] = row["pr_number"]
+            else:
+                cur.execute("INSERT INTO purchase_requests(order_id, created_at) VALUES(?,?)", (oid, now.isoformat()))
+                pr = f"PR-{now.year}-{cur.lastrowid:06d}"
+                cur.execute("UPDATE purchase_requests SET pr_number=? WHERE id=?", (pr, cur.lastrowid))
+                cur.execute("""
+                    UPDATE orders SET pr_number=?,
+                        status = CASE WHEN status IN ('Draft', 'Pending') THEN 'PR Generated' ELSE status END
+                    WHERE id=?
+                """, (pr, oid))
+                out[oid] = pr
+    return out, skipped
+
 # ---------------- Customers ----------------
 def list_customers_full() -> List[Dict[str, Any]]:
     with get_conn() as con:
@@ -216,6 +556,47 @@ def list_customers_full() -> List[Dict[str, Any]]:
         """).fetchall()
         return [dict(r) for r in rows]
 
+CUSTOMER_SEARCH_FIELDS = ("name", "username", "location", "type")
+
+def _customer_search_where(query: str, field: str = "any"):
+    """Build a prefix-match WHERE clause that can use the NOCASE customer indexes."""
+    q = (query or "").strip()
+    if not q:
+        return "", []
+    if field == "any":
+        cols = list(CUSTOMER_SEARCH_FIELDS)
+    elif field in CUSTOMER_SEARCH_FIELDS:
+        cols = [field]
+    else:
+        raise ValueError(f"Unknown customer search field: {field}")
+    pattern = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    clause = " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in cols)
+    return f"WHERE {clause}", [pattern] * len(cols)
+
+def search_customers(query: str = "", field: str = "any", limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    where, vals = _customer_search_where(query, field)
+    with get_conn() as con:
+        rows = con.execute(f"""
+            SELECT id, username, name, type, phone, email, location, contract_end_date, market_share_percent
+            FROM customers {where}
+            ORDER BY name COLLATE NOCASE, id
+            LIMIT ? OFFSET ?
+        """, vals + [int(limit), int(offset)]).fetchall()
+        return [dict(r) for r in rows]
+
+def count_customers(query: str = "", field: str = "any") -> int:
+    where, vals = _customer_search_where(query, field)
+    with get_conn() as con:
+        return con.execute(f"SELECT COUNT(*) FROM customers {where}", vals).fetchone()[0]
+
+def get_customer(customer_id: int) -> Optional[Dict[str, Any]]:
+    with get_conn() as con:
+        row = con.execute("""
+            SELECT id, username, name, type, phone, email, location, contract_end_date, market_share_percent
+            FROM customers WHERE id=?
+        """, (int(customer_id),)).fetchone()
+        return dict(row) if row else None
+
 def create_customer(
     username: str,
     password: str,
@@ -0,0 +1,296 @@
+# CLEAN FILE HEADER (DO NOT REMOVE)
+# loadtest.py — headless concurrent-session load test for Orders Portal
+# UTF-8
+#
+# Drives app.py through Streamlit's AppTest as many simulated admin and
+# customer sessions in parallel against a seeded temporary database, then
+# reports per-page rerun latency percentiles, error rates and time spent
+# waiting for the SQLite write lock.
+#
+#   python loadtest.py --customers 200 --admins 5 --workers 32
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+PASSWORD = "loadtest"
+LOCK_WAIT_THRESHOLD = 0.010  # write-lock waits above this count as contended
+
+# ---------------- Seeding ----------------
+def seed_db(path: str, customers: int, products: int):
+    os.environ["ORDERS_PORTAL_DB"] = path
+    import db
+    db.DB_PATH = path
+    db.init_db()
+    sections = ["Chemistry", "Immunology", "Hematology"]
+    analysers = ["Alinity c", "Alinity i", "Architect c", "Ruby"]
+    for i in range(products):
+        db.upsert_product(
+            f"LT{i:05d}", f"Load Test Product {i}", sections[i % len(sections)],
+            analysers[i % len(analysers)], "100T", 10.0 + i,
+        )
+    for i in range(customers):
+        db.create_customer(f"lt_customer_{i}", PASSWORD, f"Load Test Lab {i}", "Direct", location="Test City")
+    with db.get_conn() as con:
+        con.execute("UPDATE customers SET password=? WHERE username='admin'", (PASSWORD,))
+        product_ids = [r["id"] for r in con.execute("SELECT id FROM products").fetchall()]
+        customer_ids = [r["id"] for r in con.execute("SELECT id FROM customers WHERE username LIKE 'lt_customer_%'").fetchall()]
+    for cid in customer_ids[: max(1, len(customer_ids) // 4)]:
+        db.add_price_book_entry(cid, random.choice(product_ids), 5.0)
+    # one order per customer so the admin pages have data from the first rerun
+    for cid in customer_ids:
+        oid = db.add_order(cid, status=random.choice(["Draft", "Pending", "Submitted"]))
+        for pid in random.sample(product_ids, min(2, len(product_ids))):
+            db.add_order_line(oid, pid, random.randint(1, 5))
+    return product_ids
+
+# ---------------- Lock instrumentation ----------------
+# Write-lock waits (seconds) observed in this worker process, in order.
+_lock_waits: List[float] = []
+
+_WRITE_VERBS = {"INSERT", "UPDATE", "DELETE", "REPLACE"}
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        with self.connection._acquire(sql):
+            return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        with self.connection._acquire(sql):
+            return super().executemany(sql, *args)
+
+class _TimedConnection(sqlite3.Connection):
+    """Takes the write lock explicitly (BEGIN IMMEDIATE) before the first write and times the wait."""
+
+    @contextmanager
+    def _acquire(self, sql: str):
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if verb == "BEGIN":
+            t0 = time.perf_counter()
+            yield
+            _lock_waits.append(time.perf_counter() - t0)
+            return
+        if verb in _WRITE_VERBS and not self.in_transaction:
+            t0 = time.perf_counter()
+            super().execute("BEGIN IMMEDIATE")
+            _lock_waits.append(time.perf_counter() - t0)
+        yield
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+def _install_lock_timing(db):
+    @contextmanager
+    def timed_get_conn():
+        conn = sqlite3.connect(db.DB_PATH, check_same_thread=False, factory=_TimedConnection)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+    db.get_conn = timed_get_conn
+
+# ---------------- Session driver ----------------
+def _init_worker(path: str):
+    os.environ["ORDERS_PORTAL_DB"] = path
+    import db
+    db.DB_PATH = path
+    _install_lock_timing(db)
+
+class _Session:
+    """One simulated browser session; records (page, seconds, lock waits, error) per rerun."""
+
+    def __init__(self, timeout: float):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.samples: List[Dict[str, Any]] = []
+
+    def step(self, page: str, action):
+        first_wait = len(_lock_waits)
+        t0 = time.perf_counter()
+        error = None
+        try:
+            action(self.at)
+            if self.at.exception:
+                error = "; ".join(str(e.message) for e in self.at.exception)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.samples.append({
+            "page": page,
+            "seconds": time.perf_counter() - t0,
+            "lock_waits": _lock_waits[first_wait:],
+            "error": error,
+        })
+        return error is None
+
+    def login(self, username: str) -> bool:
+        if not self.step("Login form", lambda at: at.run()):
+            return False
+
+        def submit(at):
+            _by_label(at.text_input, "Username").input(username)
+            _by_label(at.text_input, "Password").input(PASSWORD)
+            _by_label(at.button, "Login").click()
+            at.run()
+            if "user" not in at.session_state or not at.session_state["user"]:
+                raise RuntimeError(f"login failed for {username!r}")
+        return self.step("Login", submit)
+
+    def goto(self, page: str) -> bool:
+        return self.step(page, lambda at: at.sidebar.radio[0].set_value(page).run())
+
+def _by_label(widgets, label: str):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"widget {label!r} not found")
+
+def run_customer_session(index: int, product_ids: List[int], timeout: float) -> List[Dict[str, Any]]:
+    s = _Session(timeout)
+    if not s.login(f"lt_customer_{index}"):
+        return s.samples
+    if not s.goto("Place Order"):
+        return s.samples
+    for pid in random.sample(product_ids, min(3, len(product_ids))):
+        def add_to_cart(at, pid=pid):
+            at.number_input(key=f"qty_{pid}").set_value(random.randint(1, 5))
+            at.button(key=f"add_{pid}").click()
+            at.run()
+        s.step("Place Order: add to cart", add_to_cart)
+    s.step("Place Order: create order", lambda at: _by_label(at.button, "Create Order (Draft)").click().run())
+    s.step("Place Order: submit", lambda at: _by_label(at.button, "Confirm and Submit").click().run())
+    s.goto("Track Orders")
+    return s.samples
+
+def run_admin_session(index: int, product_ids: List[int], timeout: float) -> List[Dict[str, Any]]:
+    s = _Session(timeout)
+    if not s.login("admin"):
+        return s.samples
+    for page in ["Orders", "Catalog & Pricing (USD)", "Customers", "Home"]:
+        s.goto(page)
+    return s.samples
+
+# ---------------- Reporting ----------------
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def _lock_stats(waits: List[float]) -> Dict[str, Any]:
+    return {
+        "write_txns": len(waits),
+        "contended_txns": sum(1 for w in waits if w > LOCK_WAIT_THRESHOLD),
+        "lock_wait_p95_ms": round(percentile(waits, 95) * 1000, 1),
+        "lock_wait_max_ms": round(max(waits, default=0.0) * 1000, 1),
+        "lock_wait_total_s": round(sum(waits), 3),
+    }
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    pages: Dict[str, List[Dict[str, Any]]] = {}
+    for smp in samples:
+        pages.setdefault(smp["page"], []).append(smp)
+    report = {"pages": {}, "total_reruns": len(samples)}
+    for page, rows in pages.items():
+        secs = [r["seconds"] for r in rows]
+        errors = [r["error"] for r in rows if r["error"]]
+        waits = [w for r in rows for w in r.get("lock_waits", [])]
+        report["pages"][page] = {
+            "reruns": len(rows),
+            "p50_ms": round(percentile(secs, 50) * 1000, 1),
+            "p95_ms": round(percentile(secs, 95) * 1000, 1),
+            "p99_ms": round(percentile(secs, 99) * 1000, 1),
+            "max_ms": round(max(secs) * 1000, 1),
+            "error_rate": round(len(errors) / len(rows), 4),
+            "lock_errors": sum(1 for e in errors if "locked" in e or "busy" in e),
+            "lock_wait_share": round(sum(waits) / sum(secs), 4) if sum(secs) else 0.0,
+            **_lock_stats(waits),
+        }
+    all_errors = [s["error"] for s in samples if s["error"]]
+    report["error_rate"] = round(len(all_errors) / len(samples), 4) if samples else 0.0
+    report["lock_errors"] = sum(1 for e in all_errors if "locked" in e or "busy" in e)
+    report["locks"] = _lock_stats([w for s in samples for w in s.get("lock_waits", [])])
+    report["sample_errors"] = sorted(set(all_errors))[:10]
+    return report
+
+def print_report(report: Dict[str, Any], wall: float, sessions: int):
+    print(f"\n{sessions} sessions, {report['total_reruns']} reruns in {wall:.1f}s")
+    print(f"{'Page':<32}{'Reruns':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'Err %':>8}"
+          f"{'Writes':>8}{'Waited':>8}{'Wait p95':>10}{'Wait %':>8}")
+    for page, r in sorted(report["pages"].items()):
+        print(f"{page:<32}{r['reruns']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}"
+              f"{r['error_rate'] * 100:>8.1f}{r['write_txns']:>8}{r['contended_txns']:>8}"
+              f"{r['lock_wait_p95_ms']:>10}{r['lock_wait_share'] * 100:>8.1f}")
+    locks = report["locks"]
+    print(f"\nOverall error rate: {report['error_rate'] * 100:.2f}%  •  database lock errors: {report['lock_errors']}")
+    print(f"Write lock: {locks['write_txns']} write transactions, {locks['contended_txns']} waited "
+          f">{LOCK_WAIT_THRESHOLD * 1000:.0f} ms, p95 {locks['lock_wait_p95_ms']} ms, "
+          f"max {locks['lock_wait_max_ms']} ms, total {locks['lock_wait_total_s']} s")
+    for e in report["sample_errors"]:
+        print(f"  ! {e}")
+
+# ---------------- CLI ----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Concurrent-session load test for Orders Portal.")
+    ap.add_argument("--customers", type=int, default=50, help="simulated customer sessions")
+    ap.add_argument("--admins", type=int, default=2, help="simulated admin sessions")
+    ap.add_argument("--workers", type=int, default=16, help="sessions running at the same time")
+    ap.add_argument("--products", type=int, default=200, help="seeded catalog size")
+    ap.add_argument("--timeout", type=float, default=60.0, help="per-rerun timeout (seconds)")
+    ap.add_argument("--json", dest="json_path", help="also write the report to this file")
+    ap.add_argument("--max-error-rate", type=float, default=None, help="exit 1 if the error rate exceeds this (0-1)")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="orders_portal_lt_") as tmp:
+        path = os.path.join(tmp, "loadtest.sqlite")
+        product_ids = seed_db(path, args.customers, args.products)
+
+        # AppTest swaps sys.modules["__main__"] for app.py inside the workers, so jobs must
+        # reference this file by its module name or they cannot be unpickled there.
+        runners = importlib.import_module("loadtest")
+        jobs = [(runners.run_customer_session, i) for i in range(args.customers)]
+        jobs += [(runners.run_admin_session, i) for i in range(args.admins)]
+        random.shuffle(jobs)
+
+        samples: List[Dict[str, Any]] = []
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=runners._init_worker, initargs=(path,)) as pool:
+            futures = [pool.submit(fn, i, product_ids, args.timeout) for fn, i in jobs]
+            for fut in as_completed(futures):
+                try:
+                    samples.extend(fut.result())
+                except Exception as e:
+                    samples.append({"page": "(session crashed)", "seconds": 0.0, "error": f"{type(e).__name__}: {e}"})
+        wall = time.perf_counter() - t0
+
+    report = summarize(samples)
+    report.update({"sessions": len(jobs), "wall_seconds": round(wall, 2)})
+    print_report(report, wall, len(jobs))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
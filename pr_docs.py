@@ -0,0 +1,82 @@
+# CLEAN FILE HEADER (DO NOT REMOVE)
+# pr_docs.py — Purchase Request document generation for Orders Portal
+# UTF-8
+
+import io
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from db import get_orders_with_lines, issue_pr_numbers
+
+# ---------------- Rendering ----------------
+def render_pr_xlsx(order: Dict[str, Any]) -> Tuple[str, bytes]:
+    """Render one order (as returned by get_orders_with_lines) to an XLSX PR. Returns (filename, bytes)."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Purchase Request"
+    bold = Font(bold=True)
+
+    ws.append(["Purchase Request", order["pr_number"]])
+    ws["A1"].font = Font(bold=True, size=14)
+    ws.append(["Order #", order["id"]])
+    ws.append(["Customer", order.get("customer_name") or ""])
+    ws.append(["Location", order.get("customer_location") or ""])
+    ws.append(["Order Date", (order.get("created_at") or "")[:10]])
+    ws.append([])
+
+    ws.append(["Code", "Product", "Qty", "Unit Price (USD)", "Line Total (USD)"])
+    for cell in ws[ws.max_row]:
+        cell.font = bold
+    for line in order["lines"]:
+        ws.append([line["code"], line["name"], line["qty"], line["unit_price_usd"], line["line_total_usd"]])
+        ws.cell(ws.max_row, 4).number_format = "#,##0.00"
+        ws.cell(ws.max_row, 5).number_format = "#,##0.00"
+    ws.append(["", "", "", "Total", order["total_usd"]])
+    ws.cell(ws.max_row, 4).font = bold
+    ws.cell(ws.max_row, 5).font = bold
+    ws.cell(ws.max_row, 5).number_format = "#,##0.00"
+
+    for col, width in zip("ABCDE", (14, 48, 8, 18, 18)):
+        ws.column_dimensions[col].width = width
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return f"{order['pr_number']}.xlsx", buf.getvalue()
+
+# ---------------- Generation ----------------
+def generate_pr_document(order_id: int) -> Tuple[Dict[str, Any], str, bytes]:
+    """Issue (or reuse) the PR number for one order and render it. Returns (order, filename, bytes)."""
+    _, skipped = issue_pr_numbers([order_id])
+    if order_id in skipped:
+        raise ValueError(f"Cannot generate a purchase request for order #{order_id}: {skipped[order_id]}")
+    order = get_orders_with_lines([order_id])[0]
+    filename, data = render_pr_xlsx(order)
+    return order, filename, data
+
+def generate_pr_bundle(
+    order_ids: List[int], max_workers: Optional[int] = None
+) -> Tuple[Dict[int, str], Dict[int, str], bytes]:
+    """Issue PR numbers for many orders, render them in a process pool and zip the documents.
+
+    Numbers are allocated and data is fetched in this process (one transaction, one query);
+    only rendering is fanned out, in spawned workers so the server process is never forked.
+    Returns ({order_id: pr_number}, {skipped order_id: reason}, zip bytes).
+    """
+    numbers, skipped = issue_pr_numbers(order_ids)
+    orders = get_orders_with_lines(list(numbers.keys()))
+    if len(orders) > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as pool:
+            docs = list(pool.map(render_pr_xlsx, orders))
+    else:
+        docs = [render_pr_xlsx(o) for o in orders]
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for filename, data in docs:
+            zf.writestr(filename, data)
+    return numbers, skipped, buf.getvalue()